@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'RAI_bezna.settings')
 
 application = get_asgi_application()
+
+# компилируем шаблонные roadmap до первого запроса
+from roadmap.template_registry import registry  # noqa: E402
+
+registry.warm_up()
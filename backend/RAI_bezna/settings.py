@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -29,6 +30,9 @@ ALLOWED_HOSTS = []
 
 AUTH_USER_MODEL = "roadmap.User"
 
+# soft-deleted пользователи не проходят аутентификацию (см. roadmap/authentication.py)
+AUTHENTICATION_BACKENDS = ['roadmap.authentication.SoftDeleteModelBackend']
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -51,6 +55,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'roadmap.db_router.ReplicaRoutingMiddleware',
+    'roadmap.activity.ActivityTrackingMiddleware',
 ]
 
 ROOT_URLCONF = 'RAI_bezna.urls'
@@ -82,9 +88,81 @@ DATABASES = {
         'NAME': 'bezna',
         'USER': 'bezna',
         'PASSWORD': '12345678',
+        'HOST': os.environ.get('DB_HOST', ''),
+        'PORT': os.environ.get('DB_PORT', ''),
+        # переиспользуем соединение между запросами вместо connect на каждый запрос
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# DB_POOL=1 -> пул соединений psycopg 3 (несовместим с CONN_MAX_AGE)
+if os.environ.get('DB_POOL'):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        },
+    }
+
+# Read-реплики: DB_REPLICAS="host[:port][/name],..." (см. roadmap/db_router.py).
+# Для локальной проверки хватит второй БД на том же сервере: DB_REPLICAS="localhost/bezna_replica".
+for i, replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(','))):
+    address, _, name = replica.partition('/')
+    host, _, port = address.partition(':')
+    DATABASES[f'replica_{i}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port,
+        'NAME': name or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['roadmap.db_router.PrimaryReplicaRouter']
+
+DB_REPLICA_ROUTING = {
+    # url names безопасных read-only endpoint'ов.
+    # Закэшированные чтения (roadmap/caching.py) сюда не входят — они заполняются с primary.
+    'READ_VIEWS': ['ai-request-status'],
+    'STICKY_SECONDS': 10,
+    'MAX_LAG': 5,
+    'LAG_CHECK_INTERVAL': 5,
+}
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# REDIS_URL задан -> общий кэш для всех воркеров, иначе (dev/tests) — память процесса.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Кэш горячих чтений (см. roadmap/caching.py)
+READ_CACHE = {
+    'TIMEOUT': 300,
+    'LOCK_TIMEOUT': 10,
+    'LOCK_WAIT': 2,
+}
+
+# User.last_active_at пишется пачкой раз в RESOLUTION секунд (см. roadmap/activity.py)
+ACTIVITY_TRACKING = {
+    'RESOLUTION': 60,
+}
+
+# Сколько дней soft-deleted пользователи/цели хранятся до purge_deleted
+SOFT_DELETE_RETENTION_DAYS = 30
+
 GENERATOR_URL = "http://192.168.1.100:8000/generate"  # пример: change to your generator host:port
 GENERATOR_SECRET = "local-shared-secret"  # простой shared secret для LAN (или use header Authorization)
 
@@ -133,9 +211,20 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'roadmap.authentication.SoftDeleteTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-}
\ No newline at end of file
+}
+
+# Admission control для POST goals/<id>/generate/ (см. roadmap/throttling.py)
+GENERATE_THROTTLE = {
+    'USER_RATE': '10/min',
+    'USER_BURST': 10,
+    'INTERACTIVE_BURST': 3,
+    'GLOBAL_RATE': '120/min',
+    'GLOBAL_BURST': 30,
+    'GLOBAL_RESERVE': 10,
+    'MAX_IN_FLIGHT_PER_USER': 2,
+}
@@ -0,0 +1,118 @@
+"""
+Буферизованный учёт активности пользователей (User.last_active_at).
+
+touch() только запоминает время в памяти процесса. Фоновый поток раз в
+ACTIVITY_TRACKING["RESOLUTION"] секунд пишет всё накопленное одним запросом
+UPDATE ... FROM (VALUES ...); при завершении воркера — финальный flush (atexit).
+Так запрос пользователя не делает ни одной записи в users.
+"""
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "RESOLUTION": 60,  # seconds
+    "BATCH_SIZE": 1000,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "ACTIVITY_TRACKING", {})}
+
+
+class ActivityTracker:
+    def __init__(self):
+        self._pending = {}  # user_id -> last seen
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stop = threading.Event()
+
+    def touch(self, user_id, when=None):
+        self._ensure_worker()
+        with self._lock:
+            self._pending[user_id] = when or timezone.now()
+
+    def _ensure_worker(self):
+        # поток запускается лениво в каждом процессе (после fork воркера)
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pending = {}
+            thread = threading.Thread(target=self._run, name="activity-flush", daemon=True)
+            thread.start()
+
+    def _run(self):
+        interval = get_config()["RESOLUTION"]
+        while not self._stop.wait(interval):
+            # любая ошибка (в т.ч. InterfaceError, не наследник DatabaseError)
+            # не должна убить поток — иначе воркер перестанет писать активность
+            try:
+                self.flush()
+                # у потока свои соединения — не держим их между flush'ами
+                connections.close_all()
+            except Exception:
+                logger.exception("activity flush loop error")
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            write_last_active(list(pending.items()), get_config()["BATCH_SIZE"])
+        except Exception:
+            logger.exception("activity flush failed, %d users re-queued", len(pending))
+            with self._lock:
+                for user_id, ts in pending.items():
+                    if self._pending.get(user_id, ts) <= ts:
+                        self._pending[user_id] = ts
+            return 0
+        return len(pending)
+
+
+def write_last_active(rows, batch_size):
+    """
+    rows: [(user_id, timestamp), ...] -> UPDATE users ... FROM (VALUES ...).
+    """
+    from .models import User
+
+    connection = connections[DEFAULT_DB_ALIAS]
+    table = connection.ops.quote_name(User._meta.db_table)
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        values = ", ".join(["(%s::uuid, %s::timestamptz)"] * len(batch))
+        params = [p for user_id, ts in batch for p in (str(user_id), ts)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} AS u SET last_active_at = v.ts "
+                f"FROM (VALUES {values}) AS v(id, ts) "
+                "WHERE u.id = v.id AND (u.last_active_at IS NULL OR u.last_active_at < v.ts)",
+                params,
+            )
+
+
+tracker = ActivityTracker()
+atexit.register(tracker.flush)
+
+
+class ActivityTrackingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        # DRF выставляет request.user (token auth) и на исходный HttpRequest
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            tracker.touch(user.pk)
+        return response
@@ -0,0 +1,20 @@
+from django.contrib.auth.backends import ModelBackend
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+
+class SoftDeleteTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, который не пускает soft-deleted пользователей.
+    """
+    def authenticate_credentials(self, key):
+        user, token = super().authenticate_credentials(key)
+        if user.deleted_at is not None:
+            raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+        return user, token
+
+
+class SoftDeleteModelBackend(ModelBackend):
+    def user_can_authenticate(self, user):
+        return super().user_can_authenticate(user) and getattr(user, "deleted_at", None) is None
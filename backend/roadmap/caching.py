@@ -0,0 +1,185 @@
+"""
+Кэш горячих чтений: достижения пользователя, достижение-аватар, шаблонные roadmap.
+
+Ключи версионированы: к ключу добавляются текущие версии namespace'ов,
+от которых зависит значение. Инвалидация = bump версии (см. signals.py),
+старые ключи просто истекают по TTL. Ключи версий тоже живут VERSION_TIMEOUT;
+новая версия стартует со значения от времени, поэтому заново созданный ключ
+не совпадёт с версиями старых значений.
+
+Значения всегда считаются с primary (DEFAULT_DB_ALIAS): иначе после bump версии
+промах мог бы заполнить кэш устаревшими данными с отстающей реплики.
+
+Stampede protection: при промахе значение считает только владелец lock'а
+(cache.add), остальные недолго ждут, пока оно появится в кэше.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+DEFAULTS = {
+    "CACHE_ALIAS": "default",
+    "TIMEOUT": 300,  # seconds
+    "VERSION_TIMEOUT": 86400,
+    "LOCK_TIMEOUT": 10,
+    "LOCK_WAIT": 2,
+    "LOCK_POLL": 0.05,
+}
+
+# namespace'ы версий
+USER_ACHIEVEMENTS = "user_achievements"
+ACHIEVEMENTS = "achievements"
+TEMPLATES = "templates"
+TEMPLATE = "template"  # дерево одного шаблона (template_registry)
+
+_MISSING = object()
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "READ_CACHE", {})}
+
+
+def get_cache():
+    return caches[get_config()["CACHE_ALIAS"]]
+
+
+def _version_key(namespace, ident=None):
+    return f"ver:{namespace}" if ident is None else f"ver:{namespace}:{ident}"
+
+
+def get_version(namespace, ident=None):
+    return get_cache().get_or_set(_version_key(namespace, ident), time.time_ns, timeout=get_config()["VERSION_TIMEOUT"])
+
+
+def bump_version(namespace, ident=None):
+    try:
+        get_cache().incr(_version_key(namespace, ident))
+    except ValueError:
+        # версии нет — значит, и закэшированных значений с ней нет
+        pass
+
+
+def make_key(name, ident, deps):
+    """
+    deps: список (namespace, ident) — версии, от которых зависит значение.
+    """
+    versions = ".".join(str(get_version(ns, i)) for ns, i in deps)
+    return f"{name}:{ident}:v{versions}"
+
+
+def _record(name, hit):
+    with _stats_lock:
+        _stats[(name, "hits" if hit else "misses")] += 1
+
+
+def get_stats():
+    """
+    Hit ratio по каждому типу значения (в рамках текущего процесса).
+    """
+    with _stats_lock:
+        names = {name for name, _ in _stats}
+        result = {}
+        for name in sorted(names):
+            hits, misses = _stats[(name, "hits")], _stats[(name, "misses")]
+            result[name] = {"hits": hits, "misses": misses, "hit_ratio": hits / (hits + misses)}
+        return result
+
+
+def get_or_compute(name, ident, deps, compute):
+    conf = get_config()
+    cache = get_cache()
+    key = make_key(name, ident, deps)
+
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        _record(name, True)
+        return value
+    _record(name, False)
+
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, timeout=conf["LOCK_TIMEOUT"]):
+        try:
+            value = compute()
+            cache.set(key, value, timeout=conf["TIMEOUT"])
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    # значение уже считает другой воркер — ждём его
+    deadline = time.monotonic() + conf["LOCK_WAIT"]
+    while time.monotonic() < deadline:
+        time.sleep(conf["LOCK_POLL"])
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+    return compute()
+
+
+# ---------------------------
+# Горячие чтения
+# ---------------------------
+def get_user_achievements(user_id):
+    """
+    Список заработанных пользователем достижений (сериализованных).
+    """
+    from .models import UserAchievement
+    from .serializers import AchievementSerializer
+
+    def compute():
+        rows = UserAchievement.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).select_related("achievement").order_by("earned_at")
+        return [AchievementSerializer(ua.achievement).data for ua in rows]
+
+    deps = [(USER_ACHIEVEMENTS, user_id), (ACHIEVEMENTS, None)]
+    return get_or_compute("user_achievements", user_id, deps, compute)
+
+
+def get_user_achievement_ids(user_id):
+    return {str(a["id"]) for a in get_user_achievements(user_id)}
+
+
+def get_avatar_achievement(user):
+    """
+    Сериализованное достижение-аватар пользователя или None.
+    """
+    from .models import Achievement
+    from .serializers import AchievementSerializer
+
+    if not user.avatar_achievement_id:
+        return None
+
+    def compute():
+        ach = Achievement.objects.using(DEFAULT_DB_ALIAS).filter(id=user.avatar_achievement_id).first()
+        return AchievementSerializer(ach).data if ach else None
+
+    return get_or_compute("achievement", user.avatar_achievement_id, [(ACHIEVEMENTS, None)], compute)
+
+
+def get_template_roadmaps():
+    from .models import Roadmap
+    from .serializers import RoadmapSerializer
+
+    def compute():
+        return RoadmapSerializer(Roadmap.objects.using(DEFAULT_DB_ALIAS).filter(is_template=True).order_by("title"), many=True).data
+
+    return get_or_compute("template_roadmaps", "all", [(TEMPLATES, None)], compute)
+
+
+def get_template_index():
+    """
+    id шаблонных roadmap и их шагов — чтобы сигналам не ходить в БД
+    на каждое сохранение шага/задачи.
+    """
+    from .models import Roadmap, RoadmapStep
+
+    def compute():
+        roadmaps = set(Roadmap.objects.using(DEFAULT_DB_ALIAS).filter(is_template=True).values_list("id", flat=True))
+        steps = dict(RoadmapStep.objects.using(DEFAULT_DB_ALIAS).filter(roadmap_id__in=roadmaps).values_list("id", "roadmap_id"))
+        return {"roadmaps": frozenset(roadmaps), "steps": steps}  # steps: step_id -> roadmap_id
+
+    return get_or_compute("template_index", "all", [(TEMPLATES, None)], compute)
@@ -0,0 +1,131 @@
+"""
+Роутинг чтений на read-реплики.
+
+На реплику идут только GET/HEAD запросы к view из DB_REPLICA_ROUTING["READ_VIEWS"].
+Всё остальное (и любые чтения после записи в том же запросе) — на primary.
+
+Read-your-writes: после запроса с записью клиент (по Authorization / session)
+на STICKY_SECONDS закрепляется за primary.
+
+Replica-lag guard: лаг каждой реплики проверяется не чаще LAG_CHECK_INTERVAL,
+реплики с лагом > MAX_LAG, standby без работающего WAL receiver и недоступные
+исключаются. Сервер не в recovery (вторая локальная БД) считается здоровым.
+"""
+import hashlib
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, DEFAULT_DB_ALIAS
+
+DEFAULTS = {
+    "CACHE_ALIAS": "default",
+    "READ_VIEWS": [],
+    "STICKY_SECONDS": 10,
+    "MAX_LAG": 5,  # seconds
+    "LAG_CHECK_INTERVAL": 5,
+}
+
+# in_recovery, WAL receiver запущен, весь полученный WAL применён, лаг (seconds)
+LAG_SQL = """
+    SELECT
+        pg_is_in_recovery(),
+        EXISTS (SELECT 1 FROM pg_stat_wal_receiver),
+        pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn(),
+        EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+"""
+
+_use_replica = ContextVar("use_replica", default=False)
+_wrote = ContextVar("wrote", default=False)
+_lag_checked = {}  # alias -> (checked_at, healthy)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "DB_REPLICA_ROUTING", {})}
+
+
+def get_replicas():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+def replica_is_healthy(alias, conf):
+    now = time.monotonic()
+    checked = _lag_checked.get(alias)
+    if checked and now - checked[0] < conf["LAG_CHECK_INTERVAL"]:
+        return checked[1]
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            in_recovery, receiving, caught_up, lag = cursor.fetchone()
+        if not in_recovery:
+            # не standby (например, вторая локальная БД) — отставать не от чего
+            healthy = True
+        else:
+            # без работающего WAL receiver реплика может отстать сколько угодно
+            healthy = bool(receiving) and (bool(caught_up) or (lag is not None and float(lag) <= conf["MAX_LAG"]))
+    except Exception:
+        healthy = False
+    _lag_checked[alias] = (now, healthy)
+    return healthy
+
+
+def _sticky_key(request):
+    credential = request.META.get("HTTP_AUTHORIZATION") or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credential:
+        return None
+    return "db:sticky:" + hashlib.sha256(credential.encode()).hexdigest()
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _use_replica.get() or _wrote.get():
+            return None
+        conf = get_config()
+        replicas = [alias for alias in get_replicas() if replica_is_healthy(alias, conf)]
+        return random.choice(replicas) if replicas else None
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # primary и реплики содержат одни и те же данные
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # реплики получают схему через репликацию
+        return False if db in get_replicas() else None
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replica_token = _use_replica.set(False)
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if _wrote.get():
+                key = _sticky_key(request)
+                if key:
+                    conf = get_config()
+                    caches[conf["CACHE_ALIAS"]].set(key, 1, timeout=conf["STICKY_SECONDS"])
+            return response
+        finally:
+            _use_replica.reset(replica_token)
+            _wrote.reset(wrote_token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ("GET", "HEAD") or not get_replicas():
+            return None
+        conf = get_config()
+        if request.resolver_match.url_name not in conf["READ_VIEWS"]:
+            return None
+        key = _sticky_key(request)
+        if key and caches[conf["CACHE_ALIAS"]].get(key):
+            return None
+        _use_replica.set(True)
+        return None
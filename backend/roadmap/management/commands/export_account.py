@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from roadmap.transfer import DEFAULT_CHUNK_SIZE, export_account
+
+
+class Command(BaseCommand):
+    help = "Экспорт аккаунта пользователя в NDJSON (stdout или --output)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("user_id")
+        parser.add_argument("--output", "-o", help="файл для записи (по умолчанию stdout)")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            # all_objects: ops может выгрузить и soft-deleted аккаунт до purge
+            user = User.all_objects.get(pk=options["user_id"])
+        except User.DoesNotExist:
+            raise CommandError(f"user {options['user_id']} not found")
+
+        lines = export_account(user, chunk_size=options["chunk_size"])
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from roadmap.transfer import DEFAULT_BATCH_SIZE, ImportFailed, import_account
+
+
+class Command(BaseCommand):
+    help = "Импорт NDJSON (из export_account) в аккаунт пользователя."
+
+    def add_arguments(self, parser):
+        parser.add_argument("user_id")
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(pk=options["user_id"])
+        except User.DoesNotExist:
+            raise CommandError(f"user {options['user_id']} not found")
+
+        with open(options["path"], encoding="utf-8") as f:
+            try:
+                # команда — доверенный импорт: шаблоны и достижения как в файле
+                counts = import_account(user, f, batch_size=options["batch_size"], trusted=True)
+            except ImportFailed as e:
+                raise CommandError(f"invalid import: {e} (already imported: {e.counts})")
+        for type_, count in counts.items():
+            self.stdout.write(f"{type_}: {count}")
@@ -0,0 +1,65 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from roadmap.models import User, Goal, Roadmap, RoadmapStep, Task, UserAchievement
+
+
+class Command(BaseCommand):
+    help = (
+        "Окончательно удаляет soft-deleted цели и пользователей старше retention. "
+        "Дерево (задачи -> шаги -> roadmap -> цели) удаляется снизу вверх "
+        "небольшими пачками, каждая в своей транзакции."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=getattr(settings, "SOFT_DELETE_RETENTION_DAYS", 30))
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--sleep", type=float, default=0.1, help="пауза между пачками, seconds")
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        self.pause = options["sleep"]
+        self.deleted = {}
+        cutoff = timezone.now() - timedelta(days=options["days"])
+
+        expired_goals = Goal.all_objects.filter(deleted_at__lt=cutoff)
+        self.purge_roadmaps(Roadmap.objects.filter(goal__in=expired_goals))
+        self.delete_in_batches(expired_goals)
+
+        expired_users = User.all_objects.filter(deleted_at__lt=cutoff)
+        # и чужие roadmap в целях пользователя (копии держат goal оригинала) —
+        # иначе их дерево удалит каскад от целей одной транзакцией
+        self.purge_roadmaps(Roadmap.objects.filter(Q(owner__in=expired_users) | Q(goal__owner__in=expired_users)))
+        self.delete_in_batches(Goal.all_objects.filter(owner__in=expired_users))
+        self.delete_in_batches(UserAchievement.objects.filter(user__in=expired_users))
+        self.delete_in_batches(expired_users)
+
+        for label, count in self.deleted.items():
+            self.stdout.write(f"{label}: {count}")
+
+    def purge_roadmaps(self, roadmaps):
+        while True:
+            ids = list(roadmaps.values_list("id", flat=True)[:self.batch_size])
+            if not ids:
+                break
+            self.delete_in_batches(Task.objects.filter(step__roadmap_id__in=ids))
+            self.delete_in_batches(RoadmapStep.objects.filter(roadmap_id__in=ids))
+            self.delete_in_batches(Roadmap.objects.filter(id__in=ids))
+
+    def delete_in_batches(self, queryset):
+        model = queryset.model
+        while True:
+            ids = list(queryset.values_list("pk", flat=True)[:self.batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                _, per_model = model._base_manager.filter(pk__in=ids).delete()
+            for label, count in per_model.items():
+                self.deleted[label] = self.deleted.get(label, 0) + count
+            time.sleep(self.pause)
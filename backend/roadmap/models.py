@@ -1,15 +1,38 @@
 # roadmaps/models.py
 import uuid
 from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.utils import timezone
 from django.conf import settings
 
 
+# ---------------------------
+# Soft delete (deleted_at)
+# ---------------------------
+class SoftDeleteManager(models.Manager):
+    """
+    Менеджер по умолчанию: скрывает строки с deleted_at.
+    Все строки (включая удалённые) — через all_objects.
+    """
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class SoftDeleteUserManager(UserManager):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class SoftDeleteMixin:
+    def soft_delete(self):
+        self.deleted_at = timezone.now()
+        self.save(update_fields=["deleted_at"])
+
+
 # ---------------------------
 # Пользователь (кастомный)
 # ---------------------------
-class User(AbstractUser):
+class User(SoftDeleteMixin, AbstractUser):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     # AbstractUser уже содержит username, email, password, first_name, last_name
     locale = models.CharField(max_length=10, blank=True, null=True)
@@ -26,21 +49,32 @@ class User(AbstractUser):
         related_name="users_with_avatar"
     )
 
+    objects = SoftDeleteUserManager()
+    all_objects = UserManager()
+
     def mark_active(self):
+        # запись в БД — пачкой, см. roadmap/activity.py
+        from .activity import tracker
+
         self.last_active_at = timezone.now()
-        self.save(update_fields=["last_active_at"])
+        tracker.touch(self.pk, self.last_active_at)
 
     class Meta:
         db_table = "users"
+        # проверки уникальности (validate_unique, формы) и auth backend'ы должны видеть
+        # и soft-deleted строки; удалённых отсекает roadmap.authentication
+        default_manager_name = "all_objects"
         indexes = [
             models.Index(fields=["email"]),
+            # для purge_deleted: только удалённые строки
+            models.Index(fields=["deleted_at"], name="users_deleted_at_idx", condition=models.Q(deleted_at__isnull=False)),
         ]
 
 
 # ---------------------------
 # Цели
 # ---------------------------
-class Goal(models.Model):
+class Goal(SoftDeleteMixin, models.Model):
     STATUS_CHOICES = [
         ("draft", "Draft"),
         ("active", "Active"),
@@ -54,6 +88,7 @@ class Goal(models.Model):
     ]
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # полный FK-индекс нужен purge_deleted и delete collector'у (owner_id IN (...) без deleted_at)
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="goals")
     title = models.CharField(max_length=500)
     description = models.TextField(blank=True)
@@ -64,11 +99,16 @@ class Goal(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     deleted_at = models.DateTimeField(null=True, blank=True)
 
+    objects = SoftDeleteManager()
+    all_objects = models.Manager()
+
     class Meta:
         db_table = "goals"
         indexes = [
-            models.Index(fields=["owner"]),
-            models.Index(fields=["status"]),
+            # удалённые цели не попадают в горячие индексы
+            models.Index(fields=["owner"], name="goals_owner_alive_idx", condition=models.Q(deleted_at__isnull=True)),
+            models.Index(fields=["status"], name="goals_status_alive_idx", condition=models.Q(deleted_at__isnull=True)),
+            models.Index(fields=["deleted_at"], name="goals_deleted_at_idx", condition=models.Q(deleted_at__isnull=False)),
         ]
 
     def __str__(self):
@@ -97,11 +137,13 @@ class AIRequest(models.Model):
     error = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    idempotency_key = models.CharField(max_length=200, null=True, blank=True)
 
     class Meta:
         db_table = "ai_requests"
         indexes = [
             models.Index(fields=["status", "created_at"]),
+            models.Index(fields=["user", "idempotency_key"], name="ai_requests_idempotency_idx"),
         ]
 
 
@@ -0,0 +1,52 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import caching
+from .models import UserAchievement, Achievement, Roadmap, RoadmapStep, Task
+
+
+# Версии бампаются только после commit'а: иначе другой воркер успел бы
+# заполнить ключ новой версии ещё старыми (незакоммиченными) данными.
+# Вне транзакции on_commit выполняется сразу.
+def _bump(using, namespace, ident=None):
+    transaction.on_commit(partial(caching.bump_version, namespace, ident), using=using)
+
+
+def _invalidate_template(using, roadmap_id):
+    _bump(using, caching.TEMPLATES)
+    _bump(using, caching.TEMPLATE, roadmap_id)
+
+
+@receiver([post_save, post_delete], sender=UserAchievement)
+def invalidate_user_achievements(sender, instance, using, **kwargs):
+    _bump(using, caching.USER_ACHIEVEMENTS, instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Achievement)
+def invalidate_achievements(sender, instance, using, **kwargs):
+    _bump(using, caching.ACHIEVEMENTS)
+
+
+# Принадлежность к шаблону проверяется по закэшированному индексу
+# (caching.get_template_index), а не запросом на каждое сохранение.
+@receiver([post_save, post_delete], sender=Roadmap)
+def invalidate_templates_on_roadmap(sender, instance, using, **kwargs):
+    # снятие флага is_template тоже должно сбросить список
+    if instance.is_template or instance.id in caching.get_template_index()["roadmaps"]:
+        _invalidate_template(using, instance.id)
+
+
+@receiver([post_save, post_delete], sender=RoadmapStep)
+def invalidate_templates_on_step(sender, instance, using, **kwargs):
+    if instance.roadmap_id in caching.get_template_index()["roadmaps"]:
+        _invalidate_template(using, instance.roadmap_id)
+
+
+@receiver([post_save, post_delete], sender=Task)
+def invalidate_templates_on_task(sender, instance, using, **kwargs):
+    roadmap_id = caching.get_template_index()["steps"].get(instance.step_id)
+    if roadmap_id:
+        _invalidate_template(using, roadmap_id)
@@ -0,0 +1,169 @@
+"""
+Реестр шаблонных roadmap (Roadmap.is_template) в памяти процесса.
+
+Дерево шаблона (шаги + задачи) компилируется один раз в неизменяемую
+структуру из tuple'ов. Инстанцирование шаблона для пользователя — только
+bulk insert, без чтения исходного дерева из БД.
+
+Актуальность проверяется по версии шаблона в кэше (caching.TEMPLATE),
+которую бампают сигналы при изменении шаблона, его шагов и задач.
+"""
+import logging
+import threading
+import uuid
+from typing import NamedTuple, Optional
+
+from django.core.cache import caches
+from django.db import connections, transaction
+
+from . import caching
+from .models import Roadmap, RoadmapStep, Task
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledTask(NamedTuple):
+    title: str
+    description: str
+    type: str
+
+
+class CompiledStep(NamedTuple):
+    title: str
+    description: str
+    order: int
+    duration_days: Optional[int]
+    parent_index: Optional[int]  # индекс родителя в CompiledTemplate.steps
+    tasks: tuple
+
+
+class CompiledTemplate(NamedTuple):
+    id: uuid.UUID
+    version: int
+    title: str
+    description: str
+    snapshot: Optional[dict]
+    steps: tuple  # родители всегда раньше детей
+
+
+def compile_template(roadmap, version):
+    steps = list(roadmap.steps.order_by("order", "created_at"))
+    tasks_by_step = {}
+    for task in Task.objects.filter(step__roadmap=roadmap).order_by("created_at"):
+        tasks_by_step.setdefault(task.step_id, []).append(
+            CompiledTask(task.title, task.description, task.type)
+        )
+
+    # топологический порядок: родитель раньше детей
+    children = {}
+    for step in steps:
+        children.setdefault(step.parent_id, []).append(step)
+    ordered, index = [], {}
+    queue = list(children.get(None, []))
+    while queue:
+        step = queue.pop(0)
+        index[step.id] = len(ordered)
+        ordered.append(step)
+        queue.extend(children.get(step.id, []))
+
+    compiled_steps = tuple(
+        CompiledStep(
+            title=step.title,
+            description=step.description,
+            order=step.order,
+            duration_days=step.duration_days,
+            parent_index=index.get(step.parent_id),
+            tasks=tuple(tasks_by_step.get(step.id, ())),
+        )
+        for step in ordered
+    )
+    return CompiledTemplate(
+        id=roadmap.id,
+        version=version,
+        title=roadmap.title,
+        description=roadmap.description,
+        snapshot=roadmap.snapshot,
+        steps=compiled_steps,
+    )
+
+
+class TemplateRegistry:
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def get(self, roadmap_id):
+        """
+        Скомпилированный шаблон или None, если roadmap_id не шаблон.
+        """
+        # не шаблон — ни запроса в БД, ни ключа версии
+        if roadmap_id not in caching.get_template_index()["roadmaps"]:
+            self._templates.pop(roadmap_id, None)
+            return None
+
+        version = caching.get_version(caching.TEMPLATE, roadmap_id)
+        compiled = self._templates.get(roadmap_id)
+        if compiled and compiled.version == version:
+            return compiled
+
+        roadmap = Roadmap.objects.filter(id=roadmap_id, is_template=True).first()
+        if roadmap is None:
+            self._templates.pop(roadmap_id, None)
+            return None
+        compiled = compile_template(roadmap, version)
+        with self._lock:
+            self._templates[roadmap_id] = compiled
+        return compiled
+
+    def warm_up(self):
+        """
+        Компилирует все шаблоны; вызывается при старте воркера (wsgi/asgi).
+        """
+        try:
+            ids = list(Roadmap.objects.filter(is_template=True).values_list("id", flat=True))
+            for roadmap_id in ids:
+                self.get(roadmap_id)
+        except Exception:
+            # БД или кэш недоступны — шаблоны скомпилируются при первом копировании
+            logger.exception("template warm-up failed")
+        finally:
+            # при preload (gunicorn --preload) воркеры не должны унаследовать сокеты мастера
+            connections.close_all()
+            caches.close_all()
+
+    def instantiate(self, compiled, owner, goal, title):
+        """
+        Создаёт копию шаблона для owner в его цели goal:
+        1 insert roadmap + bulk insert шагов и задач.
+        """
+        with transaction.atomic():
+            roadmap = Roadmap.objects.create(
+                goal=goal,
+                owner=owner,
+                title=title,
+                description=compiled.description,
+                snapshot=compiled.snapshot,
+                original_roadmap_id=compiled.id,
+            )
+            steps, tasks = [], []
+            for cs in compiled.steps:
+                step = RoadmapStep(
+                    id=uuid.uuid4(),
+                    roadmap=roadmap,
+                    parent_id=steps[cs.parent_index].id if cs.parent_index is not None else None,
+                    title=cs.title,
+                    description=cs.description,
+                    order=cs.order,
+                    duration_days=cs.duration_days,
+                )
+                steps.append(step)
+                tasks.extend(
+                    Task(step_id=step.id, title=ct.title, description=ct.description, type=ct.type)
+                    for ct in cs.tasks
+                )
+            RoadmapStep.objects.bulk_create(steps, batch_size=500)
+            Task.objects.bulk_create(tasks, batch_size=500)
+        return roadmap
+
+
+registry = TemplateRegistry()
@@ -1,3 +1,591 @@
-from django.test import TestCase
+import json
+import threading
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import pre_delete
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from . import activity, caching, db_router, throttling, views
+from .template_registry import registry
+from .transfer import ImportFailed, export_account, import_account
+from .models import User, Goal, AIRequest, Roadmap, RoadmapStep, Task, Achievement, UserAchievement
+
+THROTTLE = {
+    "USER_RATE": "6/min",
+    "USER_BURST": 3,
+    "INTERACTIVE_BURST": 1,
+    "GLOBAL_RATE": "60/min",
+    "GLOBAL_BURST": 100,
+    "GLOBAL_RESERVE": 0,
+    "MAX_IN_FLIGHT_PER_USER": 2,
+}
+
+
+class CacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+
+@override_settings(GENERATE_THROTTLE=THROTTLE)
+class GenerateThrottleTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="alice", password="x")
+        self.factory = APIRequestFactory()
+
+    def generate_request(self, data=None):
+        request = self.factory.post("/generate/", data or {}, format="json")
+        force_authenticate(request, user=self.user)
+        return request
+
+    def allow(self, now, data=None):
+        throttle = throttling.GenerateRateThrottle()
+        request = views.generate_roadmap.cls().initialize_request(self.generate_request(data))
+        with mock.patch("roadmap.throttling.time.time", return_value=now):
+            return throttle.allow_request(request, None), throttle.wait()
+
+    def test_bucket_exhausts_and_refills(self):
+        for _ in range(3):
+            self.assertTrue(self.allow(1000)[0])
+        allowed, wait = self.allow(1000)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 10)  # 6/min -> один токен за 10 секунд
+        self.assertTrue(self.allow(1010)[0])
+        self.assertFalse(self.allow(1010)[0])
+
+    def test_concurrent_requests_cannot_overspend(self):
+        results = []
+        barrier = threading.Barrier(10)
+
+        def fire():
+            request = views.generate_roadmap.cls().initialize_request(self.generate_request())
+            barrier.wait()
+            results.append(throttling.GenerateRateThrottle().allow_request(request, None))
+
+        threads = [threading.Thread(target=fire) for _ in range(10)]
+        with mock.patch("roadmap.throttling.time.time", return_value=1000):
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertEqual(results.count(True), 3)
+
+    def test_bulk_lane_keeps_global_reserve(self):
+        conf = {**THROTTLE, "GLOBAL_BURST": 2, "GLOBAL_RESERVE": 1, "GLOBAL_RATE": "1/min"}
+        with override_settings(GENERATE_THROTTLE=conf):
+            self.assertTrue(self.allow(1000, {"lane": "bulk"})[0])
+            # второй запрос подряд сервер сам считает bulk, даже без lane
+            self.assertFalse(self.allow(1000)[0])
+            # первый запрос другого пользователя — interactive, ему доступен резерв
+            self.user = User.objects.create_user(username="bob", password="x")
+            self.assertTrue(self.allow(1000)[0])
+
+    def test_over_limit_returns_429_with_retry_after(self):
+        for _ in range(3):
+            self.allow(1000)
+        with mock.patch("roadmap.throttling.time.time", return_value=1000):
+            response = views.generate_roadmap(self.generate_request(), goal_id="00000000-0000-0000-0000-000000000000")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "10")
+
+    def test_idempotent_replay_answered_with_empty_bucket(self):
+        AIRequest.objects.create(user=self.user, idempotency_key="abc", status="succeeded")
+        for _ in range(3):
+            self.allow(1000)
+        request = self.generate_request()
+        request.META["HTTP_IDEMPOTENCY_KEY"] = "abc"
+        with mock.patch("roadmap.throttling.time.time", return_value=1000):
+            response = views.generate_roadmap(request, goal_id="00000000-0000-0000-0000-000000000000")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["status"], "succeeded")
+        # новый ключ — всё так же 429
+        self.assertFalse(self.allow(1000, {"idempotency_key": "new"})[0])
+
+    def test_in_flight_cap(self):
+        with throttling.generation_slot(self.user), throttling.generation_slot(self.user):
+            with self.assertRaises(throttling.Throttled):
+                with throttling.generation_slot(self.user):
+                    pass
+        # слоты освобождены
+        with throttling.generation_slot(self.user), throttling.generation_slot(self.user):
+            pass
+
+    def test_expired_slot_release_does_not_free_new_slot(self):
+        with throttling.generation_slot(self.user):
+            # слот истёк и его занял другой запрос
+            cache.set(f"gen:inflight:{self.user.pk}:0", "other")
+        self.assertEqual(cache.get(f"gen:inflight:{self.user.pk}:0"), "other")
+
+
+def make_roadmap(owner, is_template=False, steps=1, tasks=1):
+    goal = Goal.objects.create(owner=owner, title="Goal")
+    roadmap = Roadmap.objects.create(goal=goal, owner=owner, title="Roadmap", is_template=is_template)
+    for i in range(steps):
+        step = RoadmapStep.objects.create(roadmap=roadmap, title=f"Step {i}", order=i)
+        for j in range(tasks):
+            Task.objects.create(step=step, title=f"Task {i}.{j}")
+    return roadmap
+
+
+class ReadCacheTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="alice", password="x")
+
+    def test_user_achievements_cached_and_invalidated(self):
+        self.assertEqual(caching.get_user_achievements(self.user.id), [])
+        with self.assertNumQueries(0):
+            caching.get_user_achievements(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ach = Achievement.objects.create(title="First")
+            UserAchievement.objects.create(user=self.user, achievement=ach)
+        self.assertEqual([a["title"] for a in caching.get_user_achievements(self.user.id)], ["First"])
+
+        ach.title = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            ach.save()
+        self.assertEqual([a["title"] for a in caching.get_user_achievements(self.user.id)], ["Renamed"])
+
+    def test_template_changes_invalidate_templates(self):
+        template = make_roadmap(self.user, is_template=True)
+        self.assertEqual(len(caching.get_template_roadmaps()), 1)
+        version = caching.get_version(caching.TEMPLATE, template.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(step=template.steps.get(), title="New task")
+        self.assertNotEqual(caching.get_version(caching.TEMPLATE, template.id), version)
+
+        template.is_template = False
+        with self.captureOnCommitCallbacks(execute=True):
+            template.save()
+        self.assertEqual(caching.get_template_roadmaps(), [])
+
+    def test_versions_bumped_only_after_commit(self):
+        template = make_roadmap(self.user, is_template=True)
+        caching.get_template_roadmaps()
+        version = caching.get_version(caching.TEMPLATE, template.id)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Task.objects.create(step=template.steps.get(), title="New task")
+        # до commit'а другие воркеры должны видеть старую версию
+        self.assertEqual(caching.get_version(caching.TEMPLATE, template.id), version)
+        self.assertTrue(callbacks)
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(caching.get_version(caching.TEMPLATE, template.id), version)
+
+    def test_non_template_writes_skip_template_lookup(self):
+        roadmap = make_roadmap(self.user)
+        step = roadmap.steps.get()
+        caching.get_template_index()
+        # только сам INSERT, без запроса "а не шаблон ли это"
+        with self.assertNumQueries(1):
+            Task.objects.create(step=step, title="Task")
+        self.assertIsNone(self.cache_version_key(roadmap.id))
+
+    def cache_version_key(self, roadmap_id):
+        return caching.get_cache().get(f"ver:{caching.TEMPLATE}:{roadmap_id}")
+
+    def test_stats_report_hit_ratio(self):
+        caching.get_user_achievements(self.user.id)
+        caching.get_user_achievements(self.user.id)
+        stats = caching.get_stats()["user_achievements"]
+        self.assertGreaterEqual(stats["hits"], 1)
+        self.assertGreater(stats["hit_ratio"], 0)
+
+
+class ReplicaRoutingTests(CacheTestCase):
+    status_url = "/api/v1/ai-requests/00000000-0000-0000-0000-000000000000/"
+
+    def setUp(self):
+        super().setUp()
+        self.router = db_router.PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+        db_router._lag_checked.clear()
+        self.addCleanup(db_router._lag_checked.clear)
+
+    def route(self, method, path, write=False, token="Token abc"):
+        """
+        Прогоняет запрос через middleware и возвращает alias, выбранный для чтения.
+        """
+        def get_response(request):
+            middleware.process_view(request, None, (), {})
+            if write:
+                self.router.db_for_write(AIRequest)
+            return self.router.db_for_read(AIRequest)
+
+        middleware = db_router.ReplicaRoutingMiddleware(get_response)
+        request = getattr(self.factory, method)(path, HTTP_AUTHORIZATION=token)
+        request.resolver_match = resolve(path)
+        return middleware(request)
+
+    def with_replica(self, healthy=True):
+        return mock.patch.multiple(
+            db_router,
+            get_replicas=mock.Mock(return_value=["replica_0"]),
+            replica_is_healthy=mock.Mock(return_value=healthy),
+        )
+
+    def test_safe_read_view_goes_to_replica(self):
+        with self.with_replica():
+            self.assertEqual(self.route("get", self.status_url), "replica_0")
+            # не из READ_VIEWS — primary
+            self.assertIsNone(self.route("get", "/api/v1/roadmap/templates/"))
+
+    def test_write_makes_client_sticky_to_primary(self):
+        with self.with_replica():
+            self.route("post", self.status_url, write=True)
+            self.assertIsNone(self.route("get", self.status_url))
+            # другой клиент по-прежнему читает с реплики
+            self.assertEqual(self.route("get", self.status_url, token="Token other"), "replica_0")
+
+    def test_lagging_replica_is_skipped(self):
+        with self.with_replica(healthy=False):
+            self.assertIsNone(self.route("get", self.status_url))
+
+    def check_health(self, row):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.fetchone.return_value = row
+        connection = mock.Mock()
+        connection.cursor.return_value = cursor
+        with mock.patch.object(db_router, "connections", {"replica_0": connection}):
+            db_router._lag_checked.clear()
+            return db_router.replica_is_healthy("replica_0", db_router.get_config())
+
+    def test_lag_guard(self):
+        self.assertTrue(self.check_health((False, False, None, None)))  # не standby
+        self.assertTrue(self.check_health((True, True, True, None)))
+        self.assertTrue(self.check_health((True, True, False, 1)))
+        self.assertFalse(self.check_health((True, True, False, 60)))
+        # streaming остановлен — лаг неизвестен
+        self.assertFalse(self.check_health((True, False, None, None)))
+
+    def test_replicas_are_not_migrated(self):
+        with self.with_replica():
+            self.assertFalse(self.router.allow_migrate("replica_0", "roadmap"))
+            self.assertIsNone(self.router.allow_migrate("default", "roadmap"))
+
+
+@unittest.skipUnless(db_router.get_replicas(), "нужна реплика (DB_REPLICAS, в тестах — TEST MIRROR)")
+class ReplicaMirrorTests(TransactionTestCase):
+    # соединение реплики не видит данных из незакоммиченной транзакции TestCase
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_status_read_served_from_mirror(self):
+        user = User.objects.create_user(username="alice", password="x")
+        ai = AIRequest.objects.create(user=user)
+        token = Token.objects.create(user=user)
+
+        chosen = []
+        db_for_read = db_router.PrimaryReplicaRouter.db_for_read
+
+        def spy(router, model, **hints):
+            alias = db_for_read(router, model, **hints)
+            chosen.append((model, alias))
+            return alias
+
+        with mock.patch.object(db_router.PrimaryReplicaRouter, "db_for_read", spy), \
+                mock.patch.object(db_router, "replica_is_healthy", return_value=True):
+            response = self.client.get(f"/api/v1/ai-requests/{ai.id}/", HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["id"], str(ai.id))
+        self.assertIn((AIRequest, db_router.get_replicas()[0]), chosen)
+
+
+class TemplateRegistryTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        registry._templates.clear()
+        self.addCleanup(registry._templates.clear)
+        self.author = User.objects.create_user(username="author", password="x")
+        self.user = User.objects.create_user(username="alice", password="x")
+        self.goal = Goal.objects.create(owner=self.user, title="Mine")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.template = make_roadmap(self.author, is_template=True, steps=2, tasks=3)
+            child = RoadmapStep.objects.create(roadmap=self.template, parent=self.template.steps.first(), title="Child")
+            Task.objects.create(step=child, title="Child task")
+
+    def copy(self, roadmap, **data):
+        request = APIRequestFactory().post("/copy/", data, format="json")
+        force_authenticate(request, user=self.user)
+        return views.copy_roadmap(request, roadmap_id=roadmap.id)
+
+    def test_instantiate_does_not_read_source_tree(self):
+        compiled = registry.get(self.template.id)
+        with CaptureQueriesContext(connection) as ctx:
+            copy = registry.instantiate(compiled, self.user, self.goal, "Copy")
+        self.assertFalse([q for q in ctx.captured_queries if q["sql"].lstrip().upper().startswith("SELECT")])
+        self.assertEqual(copy.steps.count(), 3)
+        self.assertEqual(Task.objects.filter(step__roadmap=copy).count(), 7)
+        self.assertEqual(copy.steps.filter(parent__isnull=False).get().parent.roadmap_id, copy.id)
+
+    def test_template_change_recompiles(self):
+        first = registry.get(self.template.id)
+        self.assertIs(registry.get(self.template.id), first)
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(step=self.template.steps.first(), title="Extra")
+        self.assertIsNot(registry.get(self.template.id), first)
+
+    def test_copy_goes_to_users_goal_with_default_title(self):
+        response = self.copy(self.template, goal_id=str(self.goal.id))
+        self.assertEqual(response.status_code, 201)
+        copy = Roadmap.objects.get(id=response.data["id"])
+        self.assertEqual(copy.goal_id, self.goal.id)
+        self.assertEqual(copy.title, "Copy of Roadmap")
+
+    def test_copy_requires_own_goal(self):
+        self.assertEqual(self.copy(self.template).status_code, 400)
+        self.assertEqual(self.copy(self.template, goal_id=str(self.template.goal_id)).status_code, 404)
+
+    def test_non_template_copy_creates_no_version_key(self):
+        roadmap = make_roadmap(self.author)
+        response = self.copy(roadmap, goal_id=str(self.goal.id))
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(caching.get_cache().get(f"ver:{caching.TEMPLATE}:{roadmap.id}"))
+
+    def test_warm_up_survives_cache_outage(self):
+        with mock.patch.object(registry, "get", side_effect=ConnectionError), \
+                mock.patch("roadmap.template_registry.connections") as connections, \
+                mock.patch("roadmap.template_registry.caches") as caches, \
+                self.assertLogs("roadmap.template_registry", "ERROR"):
+            registry.warm_up()
+        connections.close_all.assert_called_once()
+        caches.close_all.assert_called_once()
+
+
+class AccountTransferTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user(username="alice", password="x")
+        self.bob = User.objects.create_user(username="bob", password="x")
+        self.roadmap = make_roadmap(self.alice, steps=2, tasks=2)
+        root = self.roadmap.steps.first()
+        child = RoadmapStep.objects.create(roadmap=self.roadmap, parent=root, title="Child")
+        RoadmapStep.objects.create(roadmap=self.roadmap, parent=child, title="Grandchild")
+        ach = Achievement.objects.create(title="Badge")
+        UserAchievement.objects.create(user=self.alice, achievement=ach)
+        self.old = timezone.now() - timedelta(days=100)
+        Goal.objects.filter(owner=self.alice).update(created_at=self.old)
+
+    def export(self, user):
+        return list(export_account(user, chunk_size=2))
+
+    def test_round_trip(self):
+        counts = import_account(self.bob, self.export(self.alice), batch_size=2, trusted=True)
+        self.assertEqual(counts, {"goal": 1, "roadmap": 1, "step": 4, "task": 4, "achievement": 1, "user_achievement": 1})
+
+        goal = Goal.objects.get(owner=self.bob)
+        self.assertEqual(goal.created_at, self.old)  # auto_now_add не перезаписал
+        roadmap = Roadmap.objects.get(owner=self.bob)
+        self.assertEqual(roadmap.goal, goal)
+        self.assertNotEqual(roadmap.id, self.roadmap.id)
+        grandchild = RoadmapStep.objects.get(roadmap=roadmap, title="Grandchild")
+        self.assertEqual(grandchild.parent.parent.roadmap, roadmap)
+        self.assertEqual([a["title"] for a in caching.get_user_achievements(self.bob.id)], ["Badge"])
+
+    def test_steps_exported_parent_first(self):
+        seen = set()
+        for line in self.export(self.alice):
+            record = json.loads(line)
+            if record["type"] == "step":
+                parent = record["data"]["parent_id"]
+                self.assertTrue(parent is None or parent in seen)
+                seen.add(record["data"]["id"])
+
+    def test_reference_outside_export_fails_cleanly(self):
+        lines = self.export(self.alice)
+        lines = [line.replace(str(self.roadmap.goal_id), "00000000-0000-0000-0000-000000000001") if '"roadmap"' in line else line for line in lines]
+        with self.assertRaises(ImportFailed) as ctx:
+            import_account(self.bob, lines, batch_size=100)
+        self.assertIn("goal_id", str(ctx.exception))
+        self.assertFalse(Roadmap.objects.filter(owner=self.bob).exists())
+
+    def test_import_endpoint_returns_400_on_bad_input(self):
+        request = APIRequestFactory().post(
+            f"/users/{self.bob.id}/import/", b'{"type": "task", "data": {"id": "x", "step_id": "missing"}}\n',
+            content_type="application/x-ndjson",
+        )
+        force_authenticate(request, user=self.bob)
+        response = views.account_import(request, user_id=self.bob.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["imported"], {})
+
+    def test_import_endpoint_cannot_publish_template_or_award_achievements(self):
+        self.roadmap.is_template = True
+        self.roadmap.save()
+        body = "".join(self.export(self.alice)).encode()
+        request = APIRequestFactory().post(f"/users/{self.bob.id}/import/", body, content_type="application/x-ndjson")
+        force_authenticate(request, user=self.bob)
+        response = views.account_import(request, user_id=self.bob.id)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn("achievement", response.data["imported"])
+        self.assertFalse(Roadmap.objects.get(owner=self.bob).is_template)
+        self.assertEqual(Roadmap.objects.filter(is_template=True).count(), 1)
+        self.assertFalse(UserAchievement.objects.filter(user=self.bob).exists())
+        self.assertEqual(Achievement.objects.count(), 1)
+
+    def test_export_endpoint_streams(self):
+        request = APIRequestFactory().get(f"/users/{self.alice.id}/export/")
+        force_authenticate(request, user=self.alice)
+        response = views.account_export(request, user_id=self.alice.id)
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(json.loads(lines[0])["type"], "export")
+
+    def test_soft_deleted_goals_and_foreign_goal_copies_skipped(self):
+        deleted = make_roadmap(self.alice, steps=2, tasks=2)
+        deleted.goal.soft_delete()
+        # старая копия шаблона, привязанная к чужой цели
+        foreign_goal = Goal.objects.create(owner=self.bob, title="Bob's")
+        Roadmap.objects.create(goal=foreign_goal, owner=self.alice, title="Legacy copy")
+
+        counts = import_account(self.bob, self.export(self.alice))
+        self.assertEqual((counts["goal"], counts["roadmap"], counts["step"], counts["task"]), (1, 1, 4, 4))
+
+
+class SoftDeleteTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="alice", password="x")
+
+    def test_default_managers_hide_deleted_rows(self):
+        goal = Goal.objects.create(owner=self.user, title="Gone")
+        goal.soft_delete()
+        self.assertFalse(Goal.objects.exists())
+        self.assertFalse(self.user.goals.exists())
+        self.assertTrue(Goal.all_objects.exists())
+
+        self.user.soft_delete()
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+
+    def test_username_of_deleted_user_stays_unique(self):
+        self.user.soft_delete()
+        with self.assertRaises(ValidationError):
+            User(username="alice").validate_unique()
+
+    def test_deleted_user_cannot_authenticate(self):
+        token = Token.objects.create(user=self.user)
+        url = f"/api/v1/users/{self.user.id}/achievements/"
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=f"Token {token.key}").status_code, 200)
+        self.user.soft_delete()
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=f"Token {token.key}").status_code, 401)
+        self.assertFalse(self.client.login(username="alice", password="x"))
+
+
+class PurgeDeletedTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="alice", password="x")
+        self.live = make_roadmap(self.user, steps=2, tasks=2)
+        self.expired = make_roadmap(self.user, steps=3, tasks=3)
+        Goal.all_objects.filter(pk=self.expired.goal_id).update(deleted_at=timezone.now() - timedelta(days=60))
+
+    def purge(self):
+        with CaptureQueriesContext(connection) as ctx:
+            call_command("purge_deleted", days=30, batch_size=2, sleep=0, stdout=mock.Mock())
+        return [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("DELETE")]
+
+    def test_purges_expired_goal_tree_in_batches(self):
+        deletes = self.purge()
+        self.assertFalse(Roadmap.objects.filter(pk=self.expired.pk).exists())
+        self.assertFalse(Goal.all_objects.filter(pk=self.expired.goal_id).exists())
+        self.assertEqual(Task.objects.filter(step__roadmap=self.live).count(), 4)
+        # 9 задач пачками по 2 — как минимум 5 отдельных DELETE
+        task_deletes = [sql for sql in deletes if 'FROM "tasks"' in sql]
+        self.assertGreaterEqual(len(task_deletes), 5)
+
+    def test_purges_expired_user_with_everything(self):
+        # копия другого пользователя внутри цели удаляемого (make_copy_for оставляет goal)
+        other = User.objects.create_user(username="bob", password="x")
+        copy = Roadmap.objects.create(goal=self.live.goal, owner=other, title="Copy")
+        for i in range(3):
+            step = RoadmapStep.objects.create(roadmap=copy, title=f"Step {i}")
+            for j in range(3):
+                Task.objects.create(step=step, title=f"Task {i}.{j}")
+
+        User.all_objects.filter(pk=self.user.pk).update(deleted_at=timezone.now() - timedelta(days=60))
+        cascaded = []
+
+        def record_cascade(sender, instance, **kwargs):
+            if Roadmap.objects.filter(goal=instance).exists():
+                cascaded.append(instance.pk)
+
+        # к удалению цели в ней не должно остаться roadmap — иначе их дерево
+        # удалит каскад одной транзакцией, без пачек
+        pre_delete.connect(record_cascade, sender=Goal)
+        self.addCleanup(pre_delete.disconnect, record_cascade, sender=Goal)
+        self.purge()
+        self.assertEqual(cascaded, [])
+        self.assertFalse(User.all_objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Roadmap.objects.exists())
+        self.assertFalse(Goal.all_objects.exists())
+        self.assertFalse(Task.objects.exists())
+
+    def test_recently_deleted_goal_is_kept(self):
+        self.live.goal.soft_delete()
+        self.purge()
+        self.assertTrue(Goal.all_objects.filter(pk=self.live.goal_id).exists())
+
+
+class ActivityTrackerTests(TestCase):
+    def setUp(self):
+        self.tracker = activity.ActivityTracker()
+        # без фонового потока: flush вызываем сами
+        self.tracker._pid = activity.os.getpid()
+        self.user = User.objects.create_user(username="alice", password="x")
+
+    def test_mark_active_does_not_write(self):
+        with mock.patch.object(activity, "tracker", self.tracker), self.assertNumQueries(0):
+            self.user.mark_active()
+            self.user.mark_active()
+        self.assertEqual(list(self.tracker._pending), [self.user.pk])
+
+    def test_flush_writes_one_batch(self):
+        self.tracker.touch(self.user.pk)
+        with mock.patch.object(activity, "write_last_active") as write:
+            self.assertEqual(self.tracker.flush(), 1)
+        write.assert_called_once()
+        self.assertEqual(self.tracker._pending, {})
+
+    def test_failed_flush_requeues(self):
+        self.tracker.touch(self.user.pk)
+        with mock.patch.object(activity, "write_last_active", side_effect=RuntimeError), \
+                self.assertLogs("roadmap.activity", "ERROR"):
+            self.assertEqual(self.tracker.flush(), 0)
+        self.assertIn(self.user.pk, self.tracker._pending)
+
+    def test_loop_survives_errors(self):
+        stop = mock.Mock()
+        stop.wait.side_effect = [False, False, True]
+        self.tracker._stop = stop
+        with mock.patch.object(self.tracker, "flush", side_effect=[RuntimeError, 0]) as flush, \
+                mock.patch.object(activity, "connections"), \
+                self.assertLogs("roadmap.activity", "ERROR"):
+            self.tracker._run()
+        self.assertEqual(flush.call_count, 2)
+
+    @unittest.skipUnless(connection.vendor == "postgresql", "UPDATE ... FROM (VALUES ...) — PostgreSQL")
+    def test_bulk_update_sql(self):
+        now = timezone.now()
+        activity.write_last_active([(self.user.pk, now)], batch_size=100)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_active_at, now)
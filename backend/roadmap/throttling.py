@@ -0,0 +1,207 @@
+"""
+Admission control для генерации roadmap.
+
+- token bucket на пользователя и общий (глобальный), хранятся в Django cache,
+  поэтому делятся между воркерами при shared backend. Списание токена —
+  под lock'ом (cache.add), чтобы параллельные запросы не читали одно состояние;
+- приоритетные lane'ы: interactive и bulk. Lane определяет сервер: первые
+  INTERACTIVE_BURST запросов пачки — interactive, дальше — bulk (клиент может
+  только сам понизить себя до bulk). Bulk не может опустошить глобальный
+  bucket ниже GLOBAL_RESERVE — этот резерв остаётся для interactive;
+- лимит одновременных генераций на пользователя (generation_slot):
+  отдельный ключ на каждый слот, так что истёкший слот не ломает счётчик.
+
+Повтор запроса с уже известным Idempotency-Key токенов не тратит: view отдаст
+существующий AIRequest, до генератора такой запрос не доходит.
+
+Превышение лимита -> rest_framework.exceptions.Throttled -> 429 + Retry-After.
+"""
+import math
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+DEFAULTS = {
+    "CACHE_ALIAS": "default",
+    "USER_RATE": "10/min",
+    "USER_BURST": 10,
+    "INTERACTIVE_BURST": 3,  # сколько запросов подряд считаются interactive
+    "GLOBAL_RATE": "120/min",
+    "GLOBAL_BURST": 30,
+    "GLOBAL_RESERVE": 10,  # токены глобального bucket'а, недоступные для bulk
+    "LOCK_TIMEOUT": 2,  # seconds
+    "LOCK_WAIT": 0.5,
+    "LOCK_POLL": 0.005,
+    "MAX_IN_FLIGHT_PER_USER": 2,
+    "IN_FLIGHT_TTL": 120,  # seconds — страховка, если слот не был освобождён
+    "IN_FLIGHT_RETRY_AFTER": 5,
+}
+
+PERIODS = {"s": 1, "sec": 1, "m": 60, "min": 60, "h": 3600, "hour": 3600, "d": 86400, "day": 86400}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "GENERATE_THROTTLE", {})}
+
+
+def parse_rate(rate):
+    """
+    "10/min" -> токенов в секунду (float).
+    """
+    num, period = rate.split("/")
+    return int(num) / PERIODS[period]
+
+
+def get_lane(request, user_tokens, conf):
+    """
+    Lane по состоянию bucket'а пользователя (до списания токена).
+    """
+    if request.data.get("lane") == BULK:
+        return BULK
+    return INTERACTIVE if user_tokens > conf["USER_BURST"] - conf["INTERACTIVE_BURST"] else BULK
+
+
+def get_idempotency_key(request):
+    return request.headers.get("Idempotency-Key") or request.data.get("idempotency_key")
+
+
+def is_replay(request):
+    """
+    Запрос повторяет уже принятый (тот же Idempotency-Key у этого пользователя).
+    """
+    from .models import AIRequest
+
+    key = get_idempotency_key(request)
+    return bool(key) and AIRequest.objects.filter(user=request.user, idempotency_key=key).exists()
+
+
+class TokenBucket:
+    """
+    Token bucket, состояние (tokens, timestamp) хранится в cache под self.key.
+    """
+
+    def __init__(self, key, rate, burst):
+        self.key = key
+        self.refill = parse_rate(rate)
+        self.capacity = burst
+
+    @property
+    def ttl(self):
+        # после полного восстановления состояние можно забыть
+        return math.ceil(self.capacity / self.refill) + 1
+
+    def available(self, state, now):
+        if state is None:
+            return float(self.capacity)
+        tokens, ts = state
+        return min(float(self.capacity), tokens + (now - ts) * self.refill)
+
+    def wait_for(self, tokens, needed):
+        return max(0.0, (needed - tokens) / self.refill)
+
+
+@contextmanager
+def cache_lock(cache, key, conf):
+    """
+    Простой mutex на cache.add. Отдаёт False, если за LOCK_WAIT взять не удалось.
+    """
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + conf["LOCK_WAIT"]
+    acquired = cache.add(lock_key, token, timeout=conf["LOCK_TIMEOUT"])
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(conf["LOCK_POLL"])
+        acquired = cache.add(lock_key, token, timeout=conf["LOCK_TIMEOUT"])
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+class GenerateRateThrottle(BaseThrottle):
+    """
+    Per-user + глобальный token bucket для POST goals/<id>/generate/.
+    Токен списывается из обоих bucket'ов только если оба его дают.
+    """
+
+    def __init__(self):
+        self._wait = None
+
+    def allow_request(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return True
+        # DRF зовёт throttle до проверки идемпотентности во view
+        if is_replay(request):
+            return True
+
+        conf = get_config()
+        cache = caches[conf["CACHE_ALIAS"]]
+        user_bucket = TokenBucket(f"gen:bucket:{request.user.pk}", conf["USER_RATE"], conf["USER_BURST"])
+        global_bucket = TokenBucket("gen:bucket:global", conf["GLOBAL_RATE"], conf["GLOBAL_BURST"])
+
+        # порядок lock'ов всегда user -> global
+        with cache_lock(cache, user_bucket.key, conf) as user_locked, \
+                cache_lock(cache, global_bucket.key, conf) as global_locked:
+            if not (user_locked and global_locked):
+                # не смогли сериализоваться с другими запросами — fail closed
+                self._wait = conf["LOCK_TIMEOUT"]
+                return False
+
+            now = time.time()
+            states = cache.get_many([user_bucket.key, global_bucket.key])
+            user_tokens = user_bucket.available(states.get(user_bucket.key), now)
+            global_tokens = global_bucket.available(states.get(global_bucket.key), now)
+            # bulk должен оставить резерв для interactive
+            reserve = conf["GLOBAL_RESERVE"] if get_lane(request, user_tokens, conf) == BULK else 0
+
+            waits = []
+            if user_tokens < 1:
+                waits.append(user_bucket.wait_for(user_tokens, 1))
+            if global_tokens < 1 + reserve:
+                waits.append(global_bucket.wait_for(global_tokens, 1 + reserve))
+            if waits:
+                self._wait = max(waits)
+                return False
+
+            cache.set_many({
+                user_bucket.key: (user_tokens - 1, now),
+                global_bucket.key: (global_tokens - 1, now),
+            }, timeout=max(user_bucket.ttl, global_bucket.ttl))
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+@contextmanager
+def generation_slot(user):
+    """
+    Занимает один из MAX_IN_FLIGHT_PER_USER слотов генерации пользователя
+    на время выполнения блока. Если свободных нет — Throttled (429).
+    """
+    conf = get_config()
+    cache = caches[conf["CACHE_ALIAS"]]
+    token = uuid.uuid4().hex
+
+    for i in range(conf["MAX_IN_FLIGHT_PER_USER"]):
+        key = f"gen:inflight:{user.pk}:{i}"
+        if cache.add(key, token, timeout=conf["IN_FLIGHT_TTL"]):
+            break
+    else:
+        raise Throttled(wait=conf["IN_FLIGHT_RETRY_AFTER"], detail="Too many generations in progress.")
+
+    try:
+        yield
+    finally:
+        # слот мог истечь и достаться другой генерации — её не трогаем
+        if cache.get(key) == token:
+            cache.delete(key)
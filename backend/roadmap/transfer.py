@@ -0,0 +1,239 @@
+"""
+Экспорт / импорт аккаунта в NDJSON: цели, roadmap, шаги, задачи, достижения.
+
+Экспорт читает БД server-side курсорами (.iterator(chunk_size=...)) и отдаёт
+по строке на запись — память не растёт с размером аккаунта. Записи идут в
+порядке зависимостей, шаги — родитель раньше детей.
+
+Импорт пишет пачками через bulk_create, каждая пачка — своя транзакция, все id
+перевыдаются (old -> new). Ссылка на запись, которой не было раньше в файле, —
+ошибка импорта (ImportFailed); уже записанные пачки при этом остаются.
+
+Пользовательский импорт (trusted=False, эндпоинт account_import) не может
+создать шаблон или выдать себе достижение: is_template всегда False, записи
+achievement / user_achievement пропускаются. Полный импорт — только
+management-командой import_account.
+
+Формат строки: {"type": "<goal|roadmap|step|task|achievement|user_achievement>", "data": {...}}
+Первая строка — заголовок {"type": "export", "version": 1}.
+"""
+import datetime
+import json
+import uuid
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, transaction
+
+from . import caching
+from .models import Goal, Roadmap, RoadmapStep, Task, Achievement, UserAchievement
+
+FORMAT_VERSION = 1
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_BATCH_SIZE = 1000
+
+# (type, model, поля) — в порядке зависимостей
+EXPORT_SPEC = [
+    ("goal", Goal, ("id", "title", "description", "priority", "status", "visibility", "meta", "created_at")),
+    ("roadmap", Roadmap, ("id", "goal_id", "title", "description", "status", "is_template", "snapshot", "created_at")),
+    ("step", RoadmapStep, ("id", "roadmap_id", "parent_id", "title", "description", "order", "duration_days", "status")),
+    ("task", Task, ("id", "step_id", "title", "description", "type", "due_date", "status")),
+    ("achievement", Achievement, ("id", "title", "description", "image_url", "generated_by_ai")),
+    ("user_achievement", UserAchievement, ("id", "achievement_id", "earned_at", "meta")),
+]
+
+# ссылки на другие записи экспорта: поле -> тип записи, на которую оно указывает
+REFERENCE_FIELDS = {
+    "goal_id": "goal",
+    "roadmap_id": "roadmap",
+    "parent_id": "step",
+    "step_id": "step",
+    "achievement_id": "achievement",
+}
+# записи, которые пользователь не может импортировать себе сам
+TRUSTED_ONLY = ("achievement", "user_achievement")
+# auto_now_add поля: bulk_create перезаписывает их, поэтому восстанавливаем после вставки
+AUTO_TIMESTAMPS = ("created_at", "earned_at")
+
+
+class ImportFailed(ValueError):
+    def __init__(self, message, counts):
+        super().__init__(message)
+        self.counts = counts
+
+
+def _exported_roadmaps(user, prefix=""):
+    """
+    Одно правило для roadmap, шагов и задач: roadmap пользователя в его же
+    не удалённой цели. Деревья под soft-deleted целями (и под чужими целями)
+    не экспортируются — иначе файл ссылался бы на цель, которой в нём нет.
+    """
+    return {
+        f"{prefix}owner": user,
+        f"{prefix}goal__owner": user,
+        f"{prefix}goal__deleted_at__isnull": True,
+    }
+
+
+def _owned(model, user):
+    if model is Goal:
+        return Goal.objects.filter(owner=user)
+    if model is Roadmap:
+        return Roadmap.objects.filter(**_exported_roadmaps(user))
+    if model is RoadmapStep:
+        return RoadmapStep.objects.filter(**_exported_roadmaps(user, "roadmap__"))
+    if model is Task:
+        return Task.objects.filter(**_exported_roadmaps(user, "step__roadmap__"))
+    if model is Achievement:
+        return Achievement.objects.filter(users_achievements__user=user)
+    return UserAchievement.objects.filter(user=user)
+
+
+def _rows(model, user, fields, chunk_size):
+    queryset = _owned(model, user).order_by()
+    if model is not RoadmapStep:
+        yield from queryset.values(*fields).iterator(chunk_size=chunk_size)
+        return
+
+    # шаги — по уровням дерева, чтобы родитель всегда шёл раньше детей
+    depth = 0
+    while True:
+        level = queryset.filter(**{"parent__" * depth + "parent__isnull": True})
+        if depth:
+            level = level.filter(**{"parent__" * (depth - 1) + "parent__isnull": False})
+        found = False
+        for row in level.values(*fields).iterator(chunk_size=chunk_size):
+            found = True
+            yield row
+        if not found:
+            return
+        depth += 1
+
+
+class ExportEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder обрезает datetime до миллисекунд
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _dumps(record):
+    return json.dumps(record, cls=ExportEncoder, ensure_ascii=False) + "\n"
+
+
+def export_account(user, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Генератор строк NDJSON со всеми данными пользователя.
+    """
+    yield _dumps({"type": "export", "version": FORMAT_VERSION, "user_id": user.pk})
+    for type_, model, fields in EXPORT_SPEC:
+        for row in _rows(model, user, fields, chunk_size):
+            yield _dumps({"type": type_, "data": row})
+
+
+class AccountImporter:
+    """
+    Импортирует NDJSON (результат export_account) в аккаунт owner.
+    """
+
+    MODELS = {type_: model for type_, model, _ in EXPORT_SPEC}
+    FIELDS = {type_: fields for type_, _, fields in EXPORT_SPEC}
+    # id задач и user_achievement никто не ссылается — их не запоминаем
+    REFERENCED = set(REFERENCE_FIELDS.values())
+
+    def __init__(self, owner, batch_size=DEFAULT_BATCH_SIZE, trusted=False):
+        self.owner = owner
+        self.batch_size = batch_size
+        self.trusted = trusted
+        self.ids = {type_: {} for type_ in self.REFERENCED}  # type -> old id -> new id
+        self.buffers = {type_: [] for type_, _, _ in EXPORT_SPEC}
+        self.timestamps = {type_: [] for type_, _, _ in EXPORT_SPEC}
+        self.counts = defaultdict(int)
+
+    def _new_id(self, type_, old_id):
+        new_id = uuid.uuid4()
+        if type_ in self.REFERENCED:
+            ids = self.ids[type_]
+            if str(old_id) in ids:
+                raise ValueError(f"duplicate {type_} id {old_id}")
+            ids[str(old_id)] = new_id
+        return new_id
+
+    def _resolve(self, type_, field, old_id):
+        target = REFERENCE_FIELDS[field]
+        try:
+            return self.ids[target][str(old_id)]
+        except KeyError:
+            raise ValueError(f"{type_}.{field}={old_id}: no {target} with this id earlier in the file")
+
+    def _build(self, type_, data):
+        if data.get("id") is None:
+            raise ValueError(f"{type_}: id required")
+        values = {}
+        for field in self.FIELDS[type_]:
+            value = data.get(field)
+            if field == "id":
+                value = self._new_id(type_, value)
+            elif field in REFERENCE_FIELDS and value is not None:
+                value = self._resolve(type_, field, value)
+            values[field] = value
+        if type_ in ("goal", "roadmap"):
+            values["owner"] = self.owner
+        if type_ == "roadmap" and not self.trusted:
+            values["is_template"] = False
+        elif type_ == "user_achievement":
+            values["user"] = self.owner
+        self.timestamps[type_].append({f: values[f] for f in AUTO_TIMESTAMPS if values.get(f)})
+        return self.MODELS[type_](**values)
+
+    def flush(self):
+        # одна пачка — одна транзакция; родители пишутся раньше детей
+        with transaction.atomic():
+            for type_, model, fields in EXPORT_SPEC:
+                buffer, timestamps = self.buffers[type_], self.timestamps[type_]
+                if not buffer:
+                    continue
+                model.objects.bulk_create(buffer, batch_size=self.batch_size)
+                restore = [f for f in AUTO_TIMESTAMPS if f in fields]
+                if restore:
+                    for obj, original in zip(buffer, timestamps):
+                        for field, value in original.items():
+                            setattr(obj, field, value)
+                    model.objects.bulk_update(buffer, restore, batch_size=self.batch_size)
+                self.counts[type_] += len(buffer)
+                buffer.clear()
+                timestamps.clear()
+
+    def run(self, lines):
+        try:
+            for line in lines:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                type_ = record.get("type")
+                if type_ == "export":
+                    if record.get("version") != FORMAT_VERSION:
+                        raise ValueError(f"unsupported export version: {record.get('version')}")
+                    continue
+                if type_ not in self.MODELS:
+                    raise ValueError(f"unknown record type: {type_}")
+                if type_ in TRUSTED_ONLY and not self.trusted:
+                    continue
+                buffer = self.buffers[type_]
+                buffer.append(self._build(type_, record.get("data") or {}))
+                if len(buffer) >= self.batch_size:
+                    self.flush()
+            self.flush()
+        except (ValueError, ValidationError, DatabaseError) as e:
+            raise ImportFailed(str(e), dict(self.counts)) from e
+        finally:
+            # bulk_create не шлёт post_save — сбрасываем кэш вручную
+            caching.bump_version(caching.USER_ACHIEVEMENTS, self.owner.pk)
+            caching.bump_version(caching.TEMPLATES)
+        return dict(self.counts)
+
+
+def import_account(owner, lines, batch_size=DEFAULT_BATCH_SIZE, trusted=False):
+    return AccountImporter(owner, batch_size=batch_size, trusted=trusted).run(lines)
@@ -7,4 +7,9 @@ urlpatterns = [
     path("roadmap/<uuid:roadmap_id>/copy/", views.copy_roadmap, name="copy-roadmap"),
     path("tasks/<uuid:task_id>/complete/", views.complete_task, name="complete-task"),
     path("users/<uuid:user_id>/avatar/", views.set_avatar, name="set-avatar"),
+    path("users/<uuid:user_id>/achievements/", views.user_achievements, name="user-achievements"),
+    path("users/<uuid:user_id>/export/", views.account_export, name="account-export"),
+    path("users/<uuid:user_id>/import/", views.account_import, name="account-import"),
+    path("roadmap/templates/", views.template_roadmaps, name="template-roadmaps"),
+    path("cache/stats/", views.cache_stats, name="cache-stats"),
 ]
\ No newline at end of file
@@ -1,11 +1,17 @@
 from rest_framework import status, permissions
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, throttle_classes
 from rest_framework.response import Response
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.conf import settings
-from .models import AIRequest, Roadmap, RoadmapStep, Task, Achievement, UserAchievement
+from django.core.exceptions import ValidationError
+from .models import AIRequest, Goal, Roadmap, RoadmapStep, Task, Achievement, UserAchievement
 from .serializers import AIRequestSerializer, RoadmapSerializer, TaskSerializer, AchievementSerializer
 from .generator_client import call_generator
+from . import caching
+from .template_registry import registry as template_registry
+from .throttling import GenerateRateThrottle, generation_slot, get_idempotency_key
+from .transfer import ImportFailed, export_account, import_account
 from .utils import save_image_from_base64, fetch_and_save_image
 from django.db import transaction
 from time import timezone
@@ -13,17 +19,19 @@ from time import timezone
 # ========== Generate endpoint ==========
 @api_view(["POST"])
 @permission_classes([permissions.IsAuthenticated])
+@throttle_classes([GenerateRateThrottle])
 def generate_roadmap(request, goal_id):
     """
     POST /api/v1/goals/{goal_id}/generate/
-    Body: { prompt_overrides: str, constraints: {...} }
+    Body: { prompt_overrides: str, constraints: {...}, lane: "bulk" (опционально) }
+    Превышение лимитов (см. throttling.py) -> 429 + Retry-After.
     """
     user = request.user
     prompt = request.data.get("prompt_overrides", "")
     params = request.data.get("constraints", {})
 
     # idempotency check
-    idempotency_key = request.headers.get("Idempotency-Key") or request.data.get("idempotency_key")
+    idempotency_key = get_idempotency_key(request)
     if idempotency_key:
         existing = AIRequest.objects.filter(user=user, idempotency_key=idempotency_key).first()
         if existing:
@@ -31,6 +39,11 @@ def generate_roadmap(request, goal_id):
             serializer = AIRequestSerializer(existing)
             return Response(serializer.data, status=200)
 
+    with generation_slot(user):
+        return _run_generation(user, goal_id, prompt, params, idempotency_key)
+
+
+def _run_generation(user, goal_id, prompt, params, idempotency_key):
     ai = AIRequest.objects.create(user=user, goal_id=goal_id, prompt=prompt, params=params, idempotency_key=idempotency_key, status="running")
 
     # Call generator synchronously (MVP)
@@ -111,9 +124,28 @@ def ai_request_status(request, ai_request_id):
 @api_view(["POST"])
 @permission_classes([permissions.IsAuthenticated])
 def copy_roadmap(request, roadmap_id):
+    """
+    POST /api/v1/roadmap/{roadmap_id}/copy/
+    Body: { goal_id: uuid (цель текущего пользователя), new_title: str }
+    """
+    goal_id = request.data.get("goal_id")
+    if not goal_id:
+        return Response({"detail": "goal_id required"}, status=400)
+    try:
+        goal = get_object_or_404(Goal, id=goal_id, owner=request.user)
+    except ValidationError:
+        return Response({"detail": "invalid goal_id"}, status=400)
+
+    # шаблоны копируются из скомпилированного дерева, без чтения исходного
+    compiled = template_registry.get(roadmap_id)
+    if compiled is not None:
+        new_title = request.data.get("new_title", f"Copy of {compiled.title}")
+        new = template_registry.instantiate(compiled, request.user, goal, new_title)
+        return Response(RoadmapSerializer(new).data, status=201)
+
     roadmap = get_object_or_404(Roadmap, id=roadmap_id)
     new_title = request.data.get("new_title", f"Copy of {roadmap.title}")
-    new = Roadmap.objects.create(owner=request.user, title=new_title, description=roadmap.description, snapshot=roadmap.snapshot, original_roadmap=roadmap)
+    new = Roadmap.objects.create(goal=goal, owner=request.user, title=new_title, description=roadmap.description, snapshot=roadmap.snapshot, original_roadmap=roadmap)
     # shallow copy steps/tasks if needed (MVP: skip deep clone or clone minimal)
     for step in roadmap.steps.all():
         new_step = RoadmapStep.objects.create(roadmap=new, title=step.title, order=step.order)
@@ -154,10 +186,65 @@ def set_avatar(request, user_id):
         return Response({"detail": "achievement_id required"}, status=400)
     ach = get_object_or_404(Achievement, id=achievement_id)
     # check user owns it
-    if not UserAchievement.objects.filter(user=request.user, achievement=ach).exists():
+    if str(ach.id) not in caching.get_user_achievement_ids(request.user.id):
         return Response({"detail": "User does not own this achievement"}, status=403)
     # set avatar_achievement (we assume User model has avatar_achievement FK)
     user = request.user
     user.avatar_achievement_id = ach.id
     user.save(update_fields=["avatar_achievement_id"])
     return Response({"detail": "avatar set"}, status=200)
+
+
+# ========== User achievements (+ avatar) ==========
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def user_achievements(request, user_id):
+    if str(request.user.id) != str(user_id):
+        return Response({"detail": "Not allowed"}, status=403)
+    return Response({
+        "achievements": caching.get_user_achievements(request.user.id),
+        "avatar": caching.get_avatar_achievement(request.user),
+    })
+
+
+# ========== Template roadmaps ==========
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def template_roadmaps(request):
+    return Response(caching.get_template_roadmaps())
+
+
+# ========== Account export / import (NDJSON) ==========
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def account_export(request, user_id):
+    if str(request.user.id) != str(user_id):
+        return Response({"detail": "Not allowed"}, status=403)
+    response = StreamingHttpResponse(export_account(request.user), content_type="application/x-ndjson")
+    response["Content-Disposition"] = f'attachment; filename="account-{user_id}.ndjson"'
+    return response
+
+
+@api_view(["POST"])
+@permission_classes([permissions.IsAuthenticated])
+def account_import(request, user_id):
+    """
+    POST /api/v1/users/{user_id}/import/
+    Body: NDJSON из account_export (Content-Type: application/x-ndjson)
+    """
+    if str(request.user.id) != str(user_id):
+        return Response({"detail": "Not allowed"}, status=403)
+    if request.stream is None:
+        return Response({"detail": "empty body"}, status=400)
+    try:
+        counts = import_account(request.user, iter(request.stream.readline, b""))
+    except ImportFailed as e:
+        return Response({"detail": "invalid import", "error": str(e), "imported": e.counts}, status=400)
+    return Response({"imported": counts}, status=201)
+
+
+# ========== Read cache stats ==========
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def cache_stats(request):
+    return Response(caching.get_stats())